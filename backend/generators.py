@@ -1,9 +1,12 @@
 from __future__ import annotations
 
 import ast
+import io
 import os
 import re
-from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import lru_cache, wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
 # ============================================================
 # Shared helpers
@@ -22,6 +25,10 @@ AUTO_MARKERS = [
     "Professional beginner-friendly Java notes",
 ]
 
+# ASCII-only case folding, so it matches exactly what `m.lower() in line.lower()` did
+# (full Unicode folding would also treat "ı"/"İ"/"ſ" as i/s).
+_AUTO_MARKER_RE = re.compile("|".join(re.escape(m) for m in AUTO_MARKERS), re.IGNORECASE | re.ASCII)
+
 
 def _clean_existing_auto_headers(code: str) -> str:
     """
@@ -32,7 +39,7 @@ def _clean_existing_auto_headers(code: str) -> str:
     skipping = False
 
     for line in lines:
-        if any(m.lower() in line.lower() for m in AUTO_MARKERS):
+        if _AUTO_MARKER_RE.search(line) is not None:
             skipping = True
             continue
 
@@ -47,9 +54,63 @@ def _clean_existing_auto_headers(code: str) -> str:
     return cleaned + ("\n" if code.endswith("\n") else "")
 
 
-def _filename_title(file_path: str, language: str) -> str:
-    base = os.path.basename(file_path) if file_path else "pasted_code"
-    return f"{base} ({language})"
+def _leading_ws(line: str) -> str:
+    return line[: len(line) - len(line.lstrip())]
+
+
+def _base_name(file_path: str) -> Optional[str]:
+    """
+    File name shown in headers/docs; None when there is no path (pasted code).
+    Computed once per request and passed down to the language helpers.
+    """
+    return os.path.basename(file_path) if file_path else None
+
+
+# Longer stripped lines (minified or generated code) skip the per-line caches, so
+# a cache never pins thousands of huge one-line files after the request ends.
+_LINE_CACHE_MAX_CHARS = 256
+
+
+def _short_line_cache(fn: Callable[[str], Optional[str]]) -> Callable[[str], Optional[str]]:
+    """
+    lru_cache for the per-line comment lookups, applied to short lines only.
+    """
+    cached = lru_cache(maxsize=4096)(fn)
+
+    @wraps(fn)
+    def lookup(st: str) -> Optional[str]:
+        if len(st) > _LINE_CACHE_MAX_CHARS:
+            return fn(st)
+        return cached(st)
+
+    lookup.cache_info = cached.cache_info  # type: ignore[attr-defined]
+    lookup.cache_clear = cached.cache_clear  # type: ignore[attr-defined]
+    return lookup
+
+
+def _matching_line_numbers(pattern: re.Pattern, stripped: List[str]) -> Set[int]:
+    """
+    1-based numbers of the stripped lines where `pattern` matches, found with one
+    finditer over the lines joined by "\n" (patterns use (?m)^ and stay on one line).
+    """
+    text = "\n".join(stripped)
+    found: Set[int] = set()
+    line_no = 1
+    pos = 0
+    for m in pattern.finditer(text):
+        start = m.start()
+        line_no += text.count("\n", pos, start)
+        pos = start
+        found.add(line_no)
+    return found
+
+
+def _shown_name(file_name: Optional[str]) -> str:
+    return "pasted_code" if file_name is None else file_name
+
+
+def _filename_title(file_name: Optional[str], language: str) -> str:
+    return f"{_shown_name(file_name)} ({language})"
 
 
 def _doc_sectioned_no_code(
@@ -99,94 +160,175 @@ def _doc_sectioned_no_code(
 # Python (HARD MODE: AST + condition-aware comments)
 # ============================================================
 
-def _safe_parse_python(code: str) -> Tuple[Optional[ast.AST], Optional[str]]:
+# An AST takes roughly 30x the memory of its source, so only small sources are
+# cached, and only a few of them (the cache lives in every worker process).
+_PARSE_CACHE_MAX_CHARS = 16 * 1024
+
+
+def _parse(code: str) -> Tuple[Optional[ast.AST], Optional[str]]:
     try:
         return ast.parse(code), None
     except Exception as e:
         return None, f"{type(e).__name__}: {e}"
 
 
+@lru_cache(maxsize=16)
+def _parse_cached(code: str) -> Tuple[Optional[ast.AST], Optional[str]]:
+    """
+    Parse once per distinct source text; repeat requests for the same code reuse the tree.
+    Trees are shared between callers, so they must be treated as read-only.
+    """
+    return _parse(code)
+
+
+def _safe_parse_python(code: str) -> Tuple[Optional[ast.AST], Optional[str]]:
+    if len(code) > _PARSE_CACHE_MAX_CHARS:
+        return _parse(code)
+    return _parse_cached(code)
+
+
+# Each handler gets the node plus the texts of the children listed in
+# _PY_EXPR_CHILDREN (already converted, in order).
+
+def _py_name_text(node: ast.Name, parts: List[str]) -> str:
+    return node.id
+
+
+def _py_attribute_text(node: ast.Attribute, parts: List[str]) -> str:
+    return f"{parts[0]}.{node.attr}"
+
+
+def _py_constant_text(node: ast.Constant, parts: List[str]) -> str:
+    # strings with quotes to reduce confusion
+    if isinstance(node.value, str):
+        return f'"{node.value}"'
+    return str(node.value)
+
+
+def _py_call_text(node: ast.Call, parts: List[str]) -> str:
+    # common calls
+    fn = parts[0]
+    if fn.endswith("len") or fn == "len":
+        if node.args:
+            return f"length of {parts[1]}"
+    if fn.endswith("isalpha") or fn.endswith("isdigit"):
+        return f"{fn}() check"
+    if fn.endswith("strptime"):
+        return "parse a datetime"
+    if fn.endswith("split"):
+        return "split text"
+    if fn.endswith("lower"):
+        return "lowercase text"
+    if fn.endswith("upper"):
+        return "uppercase text"
+    if fn.endswith("float") or fn == "float":
+        return "convert to float"
+    if fn.endswith("int") or fn == "int":
+        return "convert to int"
+    if fn.endswith("str") or fn == "str":
+        return "convert to string"
+    return f"{fn}(...)"
+
+
+def _py_unaryop_text(node: ast.UnaryOp, parts: List[str]) -> str:
+    if isinstance(node.op, ast.Not):
+        return f"not ({parts[0]})"
+    return f"unary-op({ parts[0] })"
+
+
+def _py_boolop_text(node: ast.BoolOp, parts: List[str]) -> str:
+    op = "and" if isinstance(node.op, ast.And) else "or"
+    return f" {op} ".join(parts)
+
+
+_PY_CMP_OPS = {
+    ast.Eq: "equals",
+    ast.NotEq: "does not equal",
+    ast.Lt: "is less than",
+    ast.LtE: "is less than or equal to",
+    ast.Gt: "is greater than",
+    ast.GtE: "is greater than or equal to",
+    ast.Is: "is",
+    ast.IsNot: "is not",
+    ast.In: "is in",
+    ast.NotIn: "is not in",
+}
+
+
+def _py_compare_text(node: ast.Compare, parts: List[str]) -> str:
+    left = parts[0]
+    # only first comparator for readable text
+    if not node.ops or not node.comparators:
+        return left
+
+    op = node.ops[0]
+    right = parts[1]
+
+    op_text = _PY_CMP_OPS.get(type(op), "compares to")
+    return f"{left} {op_text} {right}"
+
+
+def _py_binop_text(node: ast.BinOp, parts: List[str]) -> str:
+    # keep it safe and light
+    return "a calculated value"
+
+
+def _py_fallback_text(node: ast.AST, parts: List[str]) -> str:
+    return "a value"
+
+
+_PY_EXPR_TEXT = {
+    ast.Name: _py_name_text,
+    ast.Attribute: _py_attribute_text,
+    ast.Constant: _py_constant_text,
+    ast.Call: _py_call_text,
+    ast.UnaryOp: _py_unaryop_text,
+    ast.BoolOp: _py_boolop_text,
+    ast.Compare: _py_compare_text,
+    ast.BinOp: _py_binop_text,
+}
+
+# sub-expressions each handler needs (any sequence, used as-is); node types not listed
+# need none
+_PY_EXPR_CHILDREN = {
+    ast.Attribute: lambda n: (n.value,),
+    ast.Call: lambda n: (n.func, n.args[0]) if n.args else (n.func,),
+    ast.UnaryOp: lambda n: (n.operand,),
+    ast.BoolOp: lambda n: n.values,
+    ast.Compare: lambda n: (n.left, n.comparators[0]) if n.ops and n.comparators else (n.left,),
+}
+
+
 def _py_expr_to_text(node: ast.AST) -> str:
     """
     Convert a Python AST expression into simple English-ish text.
     Not perfect, but designed to be safe and generally helpful.
+    Uses an explicit stack (children first, then the handler from _PY_EXPR_TEXT),
+    so long chains like a.b.c.d... cannot hit the recursion limit.
     """
-    if isinstance(node, ast.Name):
-        return node.id
-
-    if isinstance(node, ast.Attribute):
-        return f"{_py_expr_to_text(node.value)}.{node.attr}"
-
-    if isinstance(node, ast.Constant):
-        # strings with quotes to reduce confusion
-        if isinstance(node.value, str):
-            return f'"{node.value}"'
-        return str(node.value)
-
-    if isinstance(node, ast.Call):
-        # common calls
-        fn = _py_expr_to_text(node.func)
-        if fn.endswith("len") or fn == "len":
-            if node.args:
-                return f"length of {_py_expr_to_text(node.args[0])}"
-        if fn.endswith("isalpha") or fn.endswith("isdigit"):
-            return f"{fn}() check"
-        if fn.endswith("strptime"):
-            return "parse a datetime"
-        if fn.endswith("split"):
-            return "split text"
-        if fn.endswith("lower"):
-            return "lowercase text"
-        if fn.endswith("upper"):
-            return "uppercase text"
-        if fn.endswith("float") or fn == "float":
-            return "convert to float"
-        if fn.endswith("int") or fn == "int":
-            return "convert to int"
-        if fn.endswith("str") or fn == "str":
-            return "convert to string"
-        return f"{fn}(...)"
-
-    if isinstance(node, ast.UnaryOp):
-        if isinstance(node.op, ast.Not):
-            return f"not ({_py_expr_to_text(node.operand)})"
-        return f"unary-op({ _py_expr_to_text(node.operand) })"
-
-    if isinstance(node, ast.BoolOp):
-        op = "and" if isinstance(node.op, ast.And) else "or"
-        parts = [_py_expr_to_text(v) for v in node.values]
-        return f" {op} ".join(parts)
-
-    if isinstance(node, ast.Compare):
-        left = _py_expr_to_text(node.left)
-        # only first comparator for readable text
-        if not node.ops or not node.comparators:
-            return left
-
-        op = node.ops[0]
-        right = _py_expr_to_text(node.comparators[0])
-
-        op_map = {
-            ast.Eq: "equals",
-            ast.NotEq: "does not equal",
-            ast.Lt: "is less than",
-            ast.LtE: "is less than or equal to",
-            ast.Gt: "is greater than",
-            ast.GtE: "is greater than or equal to",
-            ast.Is: "is",
-            ast.IsNot: "is not",
-            ast.In: "is in",
-            ast.NotIn: "is not in",
-        }
-        op_text = op_map.get(type(op), "compares to")
-        return f"{left} {op_text} {right}"
-
-    if isinstance(node, ast.BinOp):
-        # keep it safe and light
-        return "a calculated value"
-
-    # fallback
-    return "a value"
+    results: List[str] = []
+    # (node, number of child texts to collect); -1 means children not pushed yet
+    stack: List[Tuple[ast.AST, int]] = [(node, -1)]
+    while stack:
+        n, n_parts = stack.pop()
+        if n_parts < 0:
+            children_of = _PY_EXPR_CHILDREN.get(type(n))
+            if children_of is None:
+                # leaf (names, constants, ...): convert right away, no second visit
+                results.append(_PY_EXPR_TEXT.get(type(n), _py_fallback_text)(n, []))
+                continue
+            children = children_of(n)
+            stack.append((n, len(children)))
+            stack.extend((c, -1) for c in reversed(children))
+            continue
+
+        parts: List[str] = []
+        if n_parts:
+            parts = results[-n_parts:]
+            del results[-n_parts:]
+        results.append(_PY_EXPR_TEXT.get(type(n), _py_fallback_text)(n, parts))
+
+    return results[0]
 
 
 def _py_condition_to_reason(test: ast.AST) -> str:
@@ -198,9 +340,11 @@ def _py_condition_to_reason(test: ast.AST) -> str:
     return f"because {t}"
 
 
-def _python_func_one_liner(fn: ast.FunctionDef) -> Optional[str]:
+def _python_func_one_liner(fn: ast.FunctionDef, reads_file: bool, parses_datetime: bool) -> Optional[str]:
     """
     Short helpful line for the function based on visible patterns.
+    `reads_file` / `parses_datetime` say whether anywhere under `fn` (nested
+    lambdas/defs included) opens a file in a `with` or calls `.strptime(...)`.
     """
     body = fn.body
     if not body:
@@ -221,53 +365,87 @@ def _python_func_one_liner(fn: ast.FunctionDef) -> Optional[str]:
     if len(body) == 1 and isinstance(body[0], ast.Return):
         return "Computes and returns a result."
 
-    # file reading detection
-    for node in ast.walk(fn):
-        if isinstance(node, ast.With):
-            for item in node.items:
-                if (
-                    isinstance(item.context_expr, ast.Call)
-                    and isinstance(item.context_expr.func, ast.Name)
-                    and item.context_expr.func.id == "open"
-                ):
-                    return "Reads a file and processes its contents."
-
-    # parsing detection
-    for node in ast.walk(fn):
-        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
-            if node.func.attr == "strptime":
-                return "Parses text into datetime values."
+    # file reading wins over parsing
+    if reads_file:
+        return "Reads a file and processes its contents."
+    if parses_datetime:
+        return "Parses text into datetime values."
     return None
 
 
-def _python_build_comment_maps(code: str) -> Tuple[Dict[int, str], Dict[int, str]]:
+def _python_build_comment_maps(
+    code: str, tree: Optional[ast.AST] = None, line_count: Optional[int] = None
+) -> Tuple[List[Optional[str]], List[Optional[str]]]:
     """
-    Build AST-based maps:
-    - def/class comments (line -> comment)
-    - early-return reasons (line -> comment)
+    Build AST-based line tables (index = line number, None = no comment):
+    - def/class comments
+    - early-return reasons
+    Pass `tree` when `code` was already parsed to skip parsing it again, and
+    `line_count` (= len(code.splitlines())) when the caller already split it.
     """
-    tree, _ = _safe_parse_python(code)
+    if tree is None:
+        tree, _ = _safe_parse_python(code)
     if not tree:
-        return {}, {}
-
-    def_map: Dict[int, str] = {}
-    return_reason_map: Dict[int, str] = {}
-
-    # def/class comments
-    for node in ast.walk(tree):
-        if isinstance(node, ast.ClassDef):
-            def_map[node.lineno] = f"# Class `{node.name}`: a blueprint that groups data and behavior."
-        elif isinstance(node, ast.FunctionDef):
-            hint = _python_func_one_liner(node)
+        return [], []
+
+    # splitlines() breaks on every newline the parser counts, so this bounds lineno
+    if line_count is None:
+        line_count = len(code.splitlines())
+    size = line_count + 1
+    def_map: List[Optional[str]] = [None] * size
+    return_reason_map: List[Optional[str]] = [None] * size
+
+    # single pass over the tree for both maps (explicit stack). A function pushes an
+    # exit marker under its children, so its [reads_file, parses_datetime] flags are
+    # complete when the marker pops; they then carry over to the enclosing function.
+    stack: List[Any] = [tree]
+    frames: List[List[bool]] = []
+    while stack:
+        node = stack.pop()
+        t = type(node)
+
+        if t is tuple:
+            fn, (reads_file, parses_datetime) = node
+            frames.pop()
+            if frames:
+                outer = frames[-1]
+                outer[0] = outer[0] or reads_file
+                outer[1] = outer[1] or parses_datetime
+            hint = _python_func_one_liner(fn, reads_file, parses_datetime)
             if hint:
-                def_map[node.lineno] = f"# Function `{node.name}()`: {hint}"
+                def_map[fn.lineno] = f"# Function `{fn.name}()`: {hint}"
             else:
-                def_map[node.lineno] = f"# Function `{node.name}()`: runs a reusable set of steps."
+                def_map[fn.lineno] = f"# Function `{fn.name}()`: runs a reusable set of steps."
+            continue
 
-    # reason-aware early returns inside if-blocks:
-    # if <cond>: return <value>
-    for node in ast.walk(tree):
-        if isinstance(node, ast.If):
+        if t is ast.FunctionDef:
+            frame = [False, False]
+            frames.append(frame)
+            stack.append((node, frame))
+        elif frames:
+            if t is ast.With:
+                if not frames[-1][0]:
+                    for item in node.items:
+                        if (
+                            isinstance(item.context_expr, ast.Call)
+                            and isinstance(item.context_expr.func, ast.Name)
+                            and item.context_expr.func.id == "open"
+                        ):
+                            frames[-1][0] = True
+                            break
+            elif t is ast.Call:
+                if type(node.func) is ast.Attribute and node.func.attr == "strptime":
+                    frames[-1][1] = True
+
+        stack.extend(ast.iter_child_nodes(node))
+
+        # def/class comments (functions are written when their exit marker pops)
+        if t is ast.ClassDef:
+            def_map[node.lineno] = f"# Class `{node.name}`: a blueprint that groups data and behavior."
+
+        # reason-aware early returns inside if-blocks:
+        # if <cond>: return <value>
+        elif t is ast.If:
             # only handle the common beginner pattern: single early return in the body
             if len(node.body) == 1 and isinstance(node.body[0], ast.Return):
                 ret = node.body[0]
@@ -278,196 +456,177 @@ def _python_build_comment_maps(code: str) -> Tuple[Dict[int, str], Dict[int, str
     return def_map, return_reason_map
 
 
-def _py_should_comment_line(s: str) -> bool:
-    """
-    Comment only lines beginners usually struggle with (avoid spam).
-    """
-    if not s or s.startswith("#"):
-        return False
-
-    # structure / blocks
-    if s.startswith(("def ", "class ", "if __name__", "for ", "while ", "try:", "except", "with ")):
-        return True
-
-    # imports: comment as a group, not each line (handled separately)
-    if s.startswith(("import ", "from ")):
-        return True
-
+# Every line that may get a general comment, as one pattern run with finditer over all
+# stripped lines joined by "\n" (see _matching_line_numbers). Every piece stays on one
+# line ([^\n], [^\S\n]) and matches start at a line start; comment lines never match.
+_PY_INTEREST_RE = re.compile(
+    r"(?m)^(?!#)(?:"
+    # how the line starts: structure / blocks, imports, returns, dataclass decorators
+    r"(?:def|class|for|while|with|import|from) "
+    r"|if __name__|try:|except"
+    r"|return|@dataclass"
+    # patterns anywhere inside the line that beginners usually struggle with
+    r"|[^\n]*?(?:"
     # hard patterns
-    if "lambda " in s:
-        return True
-    if " for " in s and ("[" in s and "]" in s):
-        return True
-    if "join(" in s and " for " in s:
-        return True
-
+    r"lambda "
     # parsing / validation helpers
-    if ".split(" in s and re.search(r"\.split\([^)]*,\s*\d+\s*\)", s):
-        return True
-    if "datetime.strptime" in s:
-        return True
-    if s.startswith("@dataclass") or "dataclass(" in s:
-        return True
-
+    r"|\.split\([^)\n]*,[^\S\n]*\d+[^\S\n]*\)"
+    r"|datetime\.strptime"
+    r"|dataclass\("
     # common beginner-pain builtins
-    if "enumerate(" in s:
-        return True
-    if "zip(" in s:
-        return True
-    if "sorted(" in s or ".sort(" in s:
-        return True
-    if s.startswith("return"):
-        return True
-
+    r"|enumerate\(|zip\(|sorted\(|\.sort\("
     # container helpers
-    if any(x in s for x in (".append(", ".get(", ".setdefault(", ".update(")):
-        return True
-
+    r"|\.append\(|\.get\(|\.setdefault\(|\.update\("
     # conversions
-    if re.search(r"\b(int|float|str|bool)\s*\(", s):
-        return True
-
-    return False
-
-
-def _py_comment_for_line(s: str) -> Optional[str]:
-    st = s.strip()
+    r"|\b(?:int|float|str|bool)[^\S\n]*\("
+    r")"
+    # comprehensions / joins: " for " plus brackets or join( anywhere on the line
+    r"|(?=[^\n]* for )(?:(?=[^\n]*\[)(?=[^\n]*\])|(?=[^\n]*join\())"
+    r")"
+)
+
+
+# (name, pattern, comment) in priority order. Every pattern is tried at the start of
+# the stripped line, so "contains" rules are lookaheads; the first rule that matches
+# wins, just like an if-chain. Rules with comment None are finished in
+# _py_comment_for_line.
+_PY_LINE_COMMENT_RULES: Tuple[Tuple[str, str, Optional[str]], ...] = (
+    ("dataclass", r"@dataclass", None),
+    ("main", r"if __name__", "# This part runs only when the file is executed directly."),
+    ("for", r"for ", "# Loop: repeat the indented block for each item."),
+    ("while", r"while ", "# Loop: keep repeating while the condition stays true."),
+    ("try", r"try:\Z", "# Try: run code that might fail; handle errors in `except`."),
+    ("except", r"except", "# Except: handle a specific error so the program doesn't crash."),
+    ("with_open", r"with (?=.*open\()", "# Open a file safely. It auto-closes when this block ends."),
+    ("split", r"(?=.*?\.split\([^)]*,\s*(?P<split_n>\d+)\s*\))", None),
+    ("strptime", r"(?=.*datetime\.strptime)", "# Convert a timestamp string into a real datetime value."),
+    ("list_comp", r"(?=.*\[)(?=.*\])(?=.* for )", "# List comprehension: build a list by looping in one line."),
+    ("join", r"(?=.*join\()(?=.* for )", "# Build one string by joining many pieces."),
+    ("lambda", r"(?=.*lambda )", "# lambda: a tiny one-line function (often used for sorting)."),
+    ("enumerate", r"(?=.*enumerate\()", "# enumerate(...): loop while also getting the index number."),
+    ("zip", r"(?=.*zip\()", "# zip(...): pair items from multiple lists together."),
+    ("sorted", r"(?=.*sorted\()", "# sorted(...): create a new sorted list."),
+    ("sort", r"(?=.*\.sort\()", None),
+    ("append", r"(?=.*\.append\()", "# append(): add an item to the end of the list."),
+    ("get", r"(?=.*\.get\()", "# dict.get(...): read a value safely (uses a default if missing)."),
+    ("setdefault", r"(?=.*\.setdefault\()", "# setdefault(...): get a value, or create it if it doesn't exist."),
+    ("int", r"(?=.*\bint\s*\()", "# int(...): convert to a whole number."),
+    ("float", r"(?=.*\bfloat\s*\()", "# float(...): convert to a decimal number."),
+    ("str", r"(?=.*\bstr\s*\()", "# str(...): convert to text."),
+    ("return", r"return ", "# Return: send the result back to whoever called this function."),
+)
+
+_PY_LINE_COMMENT_RE = re.compile(
+    "(?s)(?:" + "|".join(f"(?P<{name}>{pat})" for name, pat, _ in _PY_LINE_COMMENT_RULES) + ")"
+)
+_PY_LINE_COMMENTS: Dict[str, Optional[str]] = {name: c for name, _, c in _PY_LINE_COMMENT_RULES}
+
+
+@_short_line_cache
+def _py_comment_for_line(st: str) -> Optional[str]:
+    # `st` is the already-stripped line
+
+    m = _PY_LINE_COMMENT_RE.match(st)
+    if not m:
+        return None
 
-    if st.startswith("@dataclass"):
+    rule = m.lastgroup
+    if rule == "dataclass":
         if "frozen=True" in st.replace(" ", ""):
             return "# dataclass(frozen=True): makes objects immutable (fields cannot be changed)."
         return "# dataclass: auto-creates __init__ and other helper methods for a data class."
 
-    if st.startswith("if __name__"):
-        return "# This part runs only when the file is executed directly."
-
-    if st.startswith("for "):
-        return "# Loop: repeat the indented block for each item."
-
-    if st.startswith("while "):
-        return "# Loop: keep repeating while the condition stays true."
-
-    if st == "try:":
-        return "# Try: run code that might fail; handle errors in `except`."
-
-    if st.startswith("except"):
-        return "# Except: handle a specific error so the program doesn't crash."
-
-    if st.startswith("with ") and "open(" in st:
-        return "# Open a file safely. It auto-closes when this block ends."
-
-    if ".split(" in st and re.search(r"\.split\([^)]*,\s*\d+\s*\)", st):
-        m = re.search(r"\.split\([^)]*,\s*(\d+)\s*\)", st)
-        if m:
-            n = int(m.group(1))
-            return f"# split(..., {n}): split into at most {n + 1} parts (keeps the remaining text together)."
-
-    if "datetime.strptime" in st:
-        return "# Convert a timestamp string into a real datetime value."
-
-    if ("[" in st and "]" in st) and " for " in st:
-        return "# List comprehension: build a list by looping in one line."
+    if rule == "split":
+        n = int(m.group("split_n"))
+        return f"# split(..., {n}): split into at most {n + 1} parts (keeps the remaining text together)."
 
-    if "join(" in st and " for " in st:
-        return "# Build one string by joining many pieces."
-
-    if "lambda " in st:
-        return "# lambda: a tiny one-line function (often used for sorting)."
-
-    if "enumerate(" in st:
-        return "# enumerate(...): loop while also getting the index number."
-
-    if "zip(" in st:
-        return "# zip(...): pair items from multiple lists together."
-
-    if "sorted(" in st:
-        return "# sorted(...): create a new sorted list."
-    if ".sort(" in st:
+    if rule == "sort":
         if "key=" in st:
             return "# sort(key=...): reorder items using a rule (the key chooses what to sort by)."
         return "# sort(): reorder the list in place."
 
-    if ".append(" in st:
-        return "# append(): add an item to the end of the list."
-    if ".get(" in st:
-        return "# dict.get(...): read a value safely (uses a default if missing)."
-    if ".setdefault(" in st:
-        return "# setdefault(...): get a value, or create it if it doesn't exist."
-
-    if re.search(r"\bint\s*\(", st):
-        return "# int(...): convert to a whole number."
-    if re.search(r"\bfloat\s*\(", st):
-        return "# float(...): convert to a decimal number."
-    if re.search(r"\bstr\s*\(", st):
-        return "# str(...): convert to text."
+    return _PY_LINE_COMMENTS[rule]
 
-    if st.startswith("return "):
-        return "# Return: send the result back to whoever called this function."
 
-    return None
-
-
-def _python_add_comments(code: str, file_path: str) -> str:
-    code = _clean_existing_auto_headers(code)
+def _python_add_comments(code: str, file_name: Optional[str], tree: Optional[ast.AST] = None) -> str:
+    # `tree` is the parse of `code`; only reuse it if header cleanup changed nothing
+    cleaned = _clean_existing_auto_headers(code)
+    if cleaned != code:
+        tree = None
+    code = cleaned
     lines = code.splitlines()
 
-    def_map, return_reason_map = _python_build_comment_maps(code)
+    def_map, return_reason_map = _python_build_comment_maps(code, tree=tree, line_count=len(lines))
+    mapped_lines = len(def_map)
 
-    out: List[str] = []
-    out.append(f"# File: {os.path.basename(file_path) if file_path else 'pasted_code'}")
-    out.append("")
+    # `stripped` is kept in step with `out`, so every line is stripped once
+    header = f"# File: {_shown_name(file_name)}"
+    out: List[str] = [header, ""]
+    stripped: List[str] = [header.strip(), ""]
+    line_strips = [line.strip() for line in lines]
 
     # one comment for import block(s)
+    imports_note = "# Imports: bring in libraries this file depends on."
     i = 0
     while i < len(lines):
-        s = lines[i].strip()
+        s = line_strips[i]
         if s.startswith(("import ", "from ")):
             start = i
-            while i < len(lines) and lines[i].strip().startswith(("import ", "from ")):
+            while i < len(lines) and line_strips[i].startswith(("import ", "from ")):
                 i += 1
-            out.append("# Imports: bring in libraries this file depends on.")
-            for j in range(start, i):
-                out.append(lines[j])
+            out.append(imports_note)
+            stripped.append(imports_note)
+            out.extend(lines[start:i])
+            stripped.extend(line_strips[start:i])
             out.append("")
+            stripped.append("")
             continue
 
         out.append(lines[i])
+        stripped.append(s)
         i += 1
 
-    rebuilt = "\n".join(out).splitlines()
+    interesting = _matching_line_numbers(_PY_INTEREST_RE, stripped)
 
-    final: List[str] = []
-    for idx, line in enumerate(rebuilt, start=1):
-        s = line.strip()
+    def _iter_lines() -> Iterator[str]:
+        for idx, line in enumerate(out, start=1):
+            s = stripped[idx - 1]
 
-        # def/class comment from AST
-        if idx in def_map and s.startswith(("def ", "class ")):
-            indent = re.match(r"^\s*", line).group(0)
-            final.append(f"{indent}{def_map[idx]}")
-            final.append(line)
-            continue
+            # AST tables only cover the source's line count
+            if idx < mapped_lines:
+                # def/class comment from AST
+                c = def_map[idx]
+                if c is not None and s.startswith(("def ", "class ")):
+                    yield f"{_leading_ws(line)}{c}"
+                    yield line
+                    continue
 
-        # reason-aware early return (from AST if-pattern)
-        if idx in return_reason_map and s.startswith("return"):
-            indent = re.match(r"^\s*", line).group(0)
-            final.append(f"{indent}{return_reason_map[idx]}")
-            final.append(line)
-            continue
+                # reason-aware early return (from AST if-pattern)
+                c = return_reason_map[idx]
+                if c is not None and s.startswith("return"):
+                    yield f"{_leading_ws(line)}{c}"
+                    yield line
+                    continue
 
-        # general targeted comment
-        if _py_should_comment_line(s):
-            c = _py_comment_for_line(s)
-            if c:
-                indent = re.match(r"^\s*", line).group(0)
-                final.append(f"{indent}{c}")
+            # general targeted comment
+            if idx in interesting:
+                c = _py_comment_for_line(s)
+                if c:
+                    yield f"{_leading_ws(line)}{c}"
 
-        final.append(line)
+            yield line
 
-    return "\n".join(final).rstrip() + "\n"
+    return "\n".join(_iter_lines()).rstrip() + "\n"
 
 
-def _python_docs(code: str, file_path: str) -> str:
-    tree, err = _safe_parse_python(code)
+def _python_docs(
+    code: str,
+    file_name: Optional[str],
+    tree: Optional[ast.AST] = None,
+    err: Optional[str] = None,
+) -> str:
+    if tree is None and err is None:
+        tree, err = _safe_parse_python(code)
     has_input = "input(" in code.lower()
 
     what: List[str] = []
@@ -480,7 +639,7 @@ def _python_docs(code: str, file_path: str) -> str:
 
     how = [
         "1. Open a terminal in the folder containing the file.",
-        f"2. Run: `python {os.path.basename(file_path) if file_path else 'main.py'}`",
+        f"2. Run: `python {'main.py' if file_name is None else file_name}`",
         "3. Follow any prompts (if the script asks for input).",
     ]
 
@@ -503,7 +662,7 @@ def _python_docs(code: str, file_path: str) -> str:
     edge.append("Bad formats (dates/numbers) can cause errors unless handled with try/except.")
 
     return _doc_sectioned_no_code(
-        title=_filename_title(file_path, "python"),
+        title=_filename_title(file_name, "python"),
         what_it_does=what,
         requirements=requirements,
         how_to_run=how,
@@ -515,9 +674,11 @@ def _python_docs(code: str, file_path: str) -> str:
 
 def generate_python_docs(code: str, file_path: str = "pasted_code") -> Dict[str, Any]:
     code_clean = code.replace("\r\n", "\n")
+    file_name = _base_name(file_path)
+    tree, err = _safe_parse_python(code_clean)
     return {
-        "commented_code": _python_add_comments(code_clean, file_path),
-        "documentation": _python_docs(code_clean, file_path),
+        "commented_code": _python_add_comments(code_clean, file_name, tree=tree),
+        "documentation": _python_docs(code_clean, file_name, tree=tree, err=err),
     }
 
 
@@ -525,66 +686,91 @@ def generate_python_docs(code: str, file_path: str = "pasted_code") -> Dict[str,
 # JavaScript (retain)
 # ============================================================
 
-_JS_FUNC_RE = re.compile(r"^\s*(?:export\s+)?(?:async\s+)?function\s+([A-Za-z_]\w*)\s*\((.*?)\)")
-_JS_ARROW_RE = re.compile(r"^\s*(?:const|let|var)\s+([A-Za-z_]\w*)\s*=\s*(?:async\s*)?\((.*?)\)\s*=>")
-_JS_EVENT_RE = re.compile(r"\.addEventListener\s*\(")
-
-
-def _js_should_comment(s: str) -> bool:
-    if not s or s.startswith("//") or s.startswith("/*") or s.startswith("*"):
-        return False
+# (rule name, pattern, fixed comment) in priority order; the first rule that matches
+# wins. Rules with a None comment are filled in by _js_comment_for_line.
+_JS_LINE_COMMENT_RULES: Tuple[Tuple[str, str, Optional[str]], ...] = (
+    ("import", r"import ", "// Import code from another module."),
+    ("export", r"export ", "// Export this so other files can use it."),
+    (
+        "function",
+        r"\s*(?:export\s+)?(?:async\s+)?function\s+(?P<fn_name>[A-Za-z_]\w*)\s*\((?P<fn_args>.*?)\)",
+        None,
+    ),
+    (
+        "arrow",
+        r"\s*(?:const|let|var)\s+(?P<arrow_name>[A-Za-z_]\w*)\s*=\s*(?:async\s*)?\((?P<arrow_args>.*?)\)\s*=>",
+        None,
+    ),
+    ("variable", r"(?:const|let|var) ", None),
+    ("if", r"if \(", "// Only run the next block when the condition is true."),
+    ("for", r"for \(", "// Loop: repeat the next block multiple times."),
+    ("while", r"while \(", "// Loop: keep repeating while the condition stays true."),
+    ("try", r"try", "// Try running code that might fail; errors go to catch."),
+    ("catch", r"catch", "// Handle an error so the app does not crash."),
+    ("return", r"return", "// Return a result back to the caller."),
+    ("await", r"(?=.*await )", "// Wait for an async operation to finish before continuing."),
+    ("fetch", r"(?=.*fetch\()", "// Send an HTTP request to an API."),
+    ("event", r"(?=.*\.addEventListener\s*\()", "// Run this code when the user triggers an event (e.g., submit, click)."),
+    ("map", r"(?=.*map\()", "// Transform each item into a new value (map)."),
+    ("filter", r"(?=.*filter\()", "// Keep only items that match a condition (filter)."),
+    ("reduce", r"(?=.*reduce\()", "// Combine many items into one result (reduce)."),
+    ("sort", r"(?=.*sort\()", "// Sort the list into a new order."),
+    ("console_log", r"(?=.*console\.log)", "// Print a message to the console (for debugging)."),
+    ("alert", r"(?=.*alert\()", "// Show a popup message in the browser."),
+    ("prompt", r"(?=.*prompt\()", "// Ask the user for input in a popup prompt."),
+)
+
+# Lines worth a comment at all: comment lines never qualify, then either a known
+# start of line or one of the "hard" calls anywhere on the line.
+_JS_TRIGGER = (
+    r"(?!//|/\*|\*)(?:"
+    r"(?:import|export|function|async function|class|return|const|let|var) "
+    r"|if \(|for \(|while \(|try|catch"
+    r"|.*?(?:"
+    r"await |fetch\("
+    r"|document\.|querySelector|getElementById|createElement"
+    r"|\.addEventListener\s*\("
+    r"|map\(|filter\(|reduce\(|sort\("
+    r"|JSON\.parse|JSON\.stringify"
+    r"|console\.log|alert\(|prompt\("
+    r"))"
+)
+
+# Trigger check and comment rules in one anchored match per line.
+_JS_LINE_COMMENT_RE = re.compile(
+    "(?s)(?=" + _JS_TRIGGER + ")(?:"
+    + "|".join(f"(?P<{name}>{pat})" for name, pat, _ in _JS_LINE_COMMENT_RULES)
+    + ")"
+)
+_JS_LINE_COMMENTS: Dict[str, Optional[str]] = {name: c for name, _, c in _JS_LINE_COMMENT_RULES}
+
+# Same trigger searched over a whole file (any line, after its indentation); no match
+# means no line can get a comment.
+_JS_ANY_TRIGGER_RE = re.compile(r"(?m)^[^\S\n]*" + _JS_TRIGGER)
+
+
+@_short_line_cache
+def _js_comment_for_line(st: str) -> Optional[str]:
+    # `st` is the already-stripped line; None when it does not deserve a comment
+
+    m = _JS_LINE_COMMENT_RE.match(st)
+    if not m:
+        return None
 
-    starts = (
-        "import ", "export ",
-        "function ", "async function ",
-        "class ",
-        "if (", "for (", "while (",
-        "try", "catch",
-        "return ",
-        "const ", "let ", "var ",
-    )
-    if any(s.startswith(x) for x in starts):
-        return True
-
-    if "await " in s or "fetch(" in s:
-        return True
-    if "document." in s or "querySelector" in s or "getElementById" in s or "createElement" in s:
-        return True
-    if _JS_EVENT_RE.search(s):
-        return True
-    if "map(" in s or "filter(" in s or "reduce(" in s or "sort(" in s:
-        return True
-    if "JSON.parse" in s or "JSON.stringify" in s:
-        return True
-    if "console.log" in s or "alert(" in s or "prompt(" in s:
-        return True
-
-    return False
-
-
-def _js_comment_for_line(s: str) -> Optional[str]:
-    st = s.strip()
-
-    if st.startswith("import "):
-        return "// Import code from another module."
-    if st.startswith("export "):
-        return "// Export this so other files can use it."
-
-    m = _JS_FUNC_RE.match(st)
-    if m:
-        name, args = m.group(1), m.group(2)
+    rule = m.lastgroup
+    if rule == "function":
+        name, args = m.group("fn_name"), m.group("fn_args")
         if st.startswith("async"):
             return f"// Define async function {name}({args}) — can wait for promises using await."
         return f"// Define function {name}({args}) — reusable block of steps."
 
-    m2 = _JS_ARROW_RE.match(st)
-    if m2:
-        name, args = m2.group(1), m2.group(2)
+    if rule == "arrow":
+        name, args = m.group("arrow_name"), m.group("arrow_args")
         if "async" in st:
             return f"// {name}({args}) — async arrow function."
         return f"// {name}({args}) — arrow function (short function syntax)."
 
-    if st.startswith(("const ", "let ", "var ")):
+    if rule == "variable":
         if "document.getElementById" in st or "querySelector" in st:
             return "// Get an element from the page so we can read or update it."
         if "createElement" in st:
@@ -593,65 +779,31 @@ def _js_comment_for_line(s: str) -> Optional[str]:
             return "// Start an API request (fetch)."
         return "// Create a variable to store a value."
 
-    if st.startswith("if ("):
-        return "// Only run the next block when the condition is true."
-    if st.startswith("for ("):
-        return "// Loop: repeat the next block multiple times."
-    if st.startswith("while ("):
-        return "// Loop: keep repeating while the condition stays true."
-    if st.startswith("try"):
-        return "// Try running code that might fail; errors go to catch."
-    if st.startswith("catch"):
-        return "// Handle an error so the app does not crash."
-    if st.startswith("return"):
-        return "// Return a result back to the caller."
-
-    if "await " in st:
-        return "// Wait for an async operation to finish before continuing."
-    if "fetch(" in st:
-        return "// Send an HTTP request to an API."
-    if _JS_EVENT_RE.search(st):
-        return "// Run this code when the user triggers an event (e.g., submit, click)."
-    if "map(" in st:
-        return "// Transform each item into a new value (map)."
-    if "filter(" in st:
-        return "// Keep only items that match a condition (filter)."
-    if "reduce(" in st:
-        return "// Combine many items into one result (reduce)."
-    if "sort(" in st:
-        return "// Sort the list into a new order."
-    if "console.log" in st:
-        return "// Print a message to the console (for debugging)."
-    if "alert(" in st:
-        return "// Show a popup message in the browser."
-    if "prompt(" in st:
-        return "// Ask the user for input in a popup prompt."
-
-    return None
+    return _JS_LINE_COMMENTS[rule]
 
 
-def _comment_js(code: str, file_path: str) -> str:
+def _comment_js(code: str, file_name: Optional[str]) -> str:
     code = _clean_existing_auto_headers(code)
-    lines = code.splitlines()
-    out: List[str] = []
-    out.append(f"// File: {os.path.basename(file_path) if file_path else 'pasted_code'}")
-    out.append("")
+    header = f"// File: {_shown_name(file_name)}\n"
 
-    for line in lines:
-        s = line.strip()
-        if _js_should_comment(s):
-            c = _js_comment_for_line(s)
+    # cleaned code only has "\n" line breaks, so it is already the uncommented output
+    if _JS_ANY_TRIGGER_RE.search(code) is None:
+        return (header + "\n" + code).rstrip() + "\n"
+
+    def _iter_lines(lines: List[str]) -> Iterator[str]:
+        yield header
+        for line in lines:
+            c = _js_comment_for_line(line.strip())
             if c:
-                indent = re.match(r"^\s*", line).group(0)
-                out.append(f"{indent}{c}")
-        out.append(line)
+                yield f"{_leading_ws(line)}{c}"
+            yield line
 
-    return "\n".join(out).rstrip() + "\n"
+    return "\n".join(_iter_lines(code.splitlines())).rstrip() + "\n"
 
 
-def _js_docs(file_path: str) -> str:
+def _js_docs(file_name: Optional[str]) -> str:
     return _doc_sectioned_no_code(
-        title=_filename_title(file_path, "javascript"),
+        title=_filename_title(file_name, "javascript"),
         what_it_does=["Adds logic to a web page (or runs as a Node.js script)."],
         requirements=["Browser (web) or Node.js (backend)."],
         how_to_run=[
@@ -701,65 +853,94 @@ _HTML_TAG_HINTS = {
 }
 
 
-def _html_attribute_notes(line: str) -> List[str]:
-    s = line.strip()
-    low = s.lower()
-    notes: List[str] = []
-
-    if "required" in low:
-        notes.append("required: user must fill this before submitting.")
-    if "minlength" in low:
-        notes.append("minlength: minimum number of characters allowed.")
-    if 'type="number"' in low or "type='number'" in low:
-        notes.append("type=number: input expects numeric values.")
-    if "step=" in low:
-        notes.append("step: allowed increments (e.g., 0.01 for money).")
-    if re.search(r"\bmin\s*=", low):
-        notes.append("min: smallest allowed value.")
-    if "aria-" in low:
-        notes.append("aria-*: helps screen readers understand the page (accessibility).")
-    if "aria-labelledby" in low:
-        notes.append("aria-labelledby: connects this section to a heading for accessibility.")
-    if re.search(r"\bfor\s*=", low) and re.search(r"\bid\s*=", low):
-        notes.append("for/id: links <label> to <input> (clicking label focuses input).")
-    if re.search(r"\bname\s*=", low):
-        notes.append("name: key used when reading form values in JavaScript.")
-    if re.search(r"\bid\s*=", low):
-        notes.append("id: unique identifier (used for selecting the element in JS/CSS).")
-    return notes
-
-
-def _comment_html(code: str, file_path: str) -> str:
+def _html_tag_name(s: str) -> Optional[str]:
+    """
+    Tag name at the start of a left-stripped line ("< input ..." -> "input"), else None.
+    Only ASCII letters/digits count, and the name must end at a non-word char.
+    """
+    if not s.startswith("<"):
+        return None
+
+    n = len(s)
+    i = 1
+    while i < n and s[i].isspace():
+        i += 1
+    j = i
+    while j < n and s[j].isascii() and s[j].isalnum():
+        j += 1
+    if j == i or (j < n and (s[j].isalnum() or s[j] == "_")):
+        return None
+    return s[i:j].lower()
+
+
+# every attribute keyword, found in one finditer pass. Matches never overlap a
+# keyword that must also be found, so one pass sees them all; "aria-labelledby"
+# also counts as "aria-", and for/id only counts when both are present.
+_HTML_ATTR_RE = re.compile(
+    r"(?P<required>required)"
+    r"|(?P<minlength>minlength)"
+    r"|(?P<number>type=(?:\"number\"|'number'))"
+    r"|(?P<step>step=)"
+    r"|(?P<aria>aria-)(?P<aria_labelledby>labelledby)?"
+    r"|\b(?:(?P<min>min)|(?P<for>for)|(?P<id>id)|(?P<name>name))\s*="
+)
+
+# (key, note) in the order notes are shown
+_HTML_ATTR_NOTES: Tuple[Tuple[str, str], ...] = (
+    ("required", "required: user must fill this before submitting."),
+    ("minlength", "minlength: minimum number of characters allowed."),
+    ("number", "type=number: input expects numeric values."),
+    ("step", "step: allowed increments (e.g., 0.01 for money)."),
+    ("min", "min: smallest allowed value."),
+    ("aria", "aria-*: helps screen readers understand the page (accessibility)."),
+    ("aria_labelledby", "aria-labelledby: connects this section to a heading for accessibility."),
+    ("for_id", "for/id: links <label> to <input> (clicking label focuses input)."),
+    ("name", "name: key used when reading form values in JavaScript."),
+    ("id", "id: unique identifier (used for selecting the element in JS/CSS)."),
+)
+
+
+def _html_attribute_notes(st: str) -> List[str]:
+    # `st` is the already-stripped line
+    found: Set[str] = set()
+    for m in _HTML_ATTR_RE.finditer(st.lower()):
+        found.add(m.lastgroup)
+
+    if not found:
+        return []
+    if "aria_labelledby" in found:
+        found.add("aria")
+    if "for" in found and "id" in found:
+        found.add("for_id")
+    return [note for key, note in _HTML_ATTR_NOTES if key in found]
+
+
+def _comment_html(code: str, file_name: Optional[str]) -> str:
     code = _clean_existing_auto_headers(code)
-    lines = code.splitlines()
-    out: List[str] = []
-    out.append(f"<!-- File: {os.path.basename(file_path) if file_path else 'pasted_code'} -->")
-    out.append("")
 
-    tag_re = re.compile(r"^\s*<\s*([a-zA-Z0-9]+)\b")
-    for line in lines:
-        m = tag_re.match(line)
-        if m:
-            tag = m.group(1).lower()
-            hint = _HTML_TAG_HINTS.get(tag)
-            if hint:
-                indent = re.match(r"^\s*", line).group(0)
-                out.append(f"{indent}<!-- {hint} -->")
+    def _iter_lines(lines: List[str]) -> Iterator[str]:
+        yield f"<!-- File: {_shown_name(file_name)} -->\n"
+        for line in lines:
+            s = line.lstrip()
+            indent = line[: len(line) - len(s)]
 
-        notes = _html_attribute_notes(line)
-        if notes:
-            indent = re.match(r"^\s*", line).group(0)
-            for n in notes:
-                out.append(f"{indent}<!-- {n} -->")
+            tag = _html_tag_name(s)
+            if tag:
+                hint = _HTML_TAG_HINTS.get(tag)
+                if hint:
+                    yield f"{indent}<!-- {hint} -->"
 
-        out.append(line)
+            for n in _html_attribute_notes(s.rstrip()):
+                yield f"{indent}<!-- {n} -->"
 
-    return "\n".join(out).rstrip() + "\n"
+            yield line
 
+    return "\n".join(_iter_lines(code.splitlines())).rstrip() + "\n"
 
-def _html_docs(file_path: str) -> str:
+
+def _html_docs(file_name: Optional[str]) -> str:
     return _doc_sectioned_no_code(
-        title=_filename_title(file_path, "html"),
+        title=_filename_title(file_name, "html"),
         what_it_does=["Defines the structure and content of a web page."],
         requirements=["A web browser."],
         how_to_run=["1. Save as `.html`", "2. Open in a browser."],
@@ -777,45 +958,57 @@ def _html_docs(file_path: str) -> str:
 # CSS (retain)
 # ============================================================
 
-def _comment_css(code: str, file_path: str) -> str:
+# Lines that may get a CSS note; run with _matching_line_numbers over the stripped lines
+_CSS_NOTE_LINE_RE = re.compile(r"(?m)^(?::root|@media|padding:|margin:|gap:|[^\n]*display: (?:flex|grid))")
+
+
+def _comment_css(code: str, file_name: Optional[str]) -> str:
     code = _clean_existing_auto_headers(code)
     lines = code.splitlines()
-    out: List[str] = []
-    out.append(f"/* File: {os.path.basename(file_path) if file_path else 'pasted_code'} */")
-    out.append("")
-
-    for line in lines:
-        s = line.strip()
+    stripped = [line.strip() for line in lines]
+    buf = io.StringIO()
+    buf.write(f"/* File: {_shown_name(file_name)} */\n")
+    buf.write("\n")
+
+    # most lines get no note: copy the runs between noted lines in one write each
+    prev = 0
+    for line_no in sorted(_matching_line_numbers(_CSS_NOTE_LINE_RE, stripped)):
+        i = line_no - 1
+        if i > prev:
+            buf.write("\n".join(lines[prev:i]))
+            buf.write("\n")
+        prev = i
+        s = stripped[i]
 
         if s.startswith(":root"):
-            out.append("/* :root holds global CSS variables (reusable values). */")
+            buf.write("/* :root holds global CSS variables (reusable values). */\n")
 
         if s.startswith("@media"):
-            out.append("/* Responsive design: rules apply only on certain screen sizes. */")
+            buf.write("/* Responsive design: rules apply only on certain screen sizes. */\n")
 
         if "display: flex" in s:
-            out.append("/* Flex layout: helps align items in a row/column. */")
+            buf.write("/* Flex layout: helps align items in a row/column. */\n")
 
         if "display: grid" in s:
-            out.append("/* Grid layout: helps build rows/columns layout. */")
+            buf.write("/* Grid layout: helps build rows/columns layout. */\n")
 
         if s.startswith("padding:"):
-            out.append("/* Padding = space inside the element. */")
+            buf.write("/* Padding = space inside the element. */\n")
 
         if s.startswith("margin:"):
-            out.append("/* Margin = space outside the element. */")
+            buf.write("/* Margin = space outside the element. */\n")
 
         if s.startswith("gap:"):
-            out.append("/* Gap = space between items in flex/grid layouts. */")
+            buf.write("/* Gap = space between items in flex/grid layouts. */\n")
 
-        out.append(line)
+    buf.write("\n".join(lines[prev:]))
 
-    return "\n".join(out).rstrip() + "\n"
+    return buf.getvalue().rstrip() + "\n"
 
 
-def _css_docs(file_path: str) -> str:
+def _css_docs(file_name: Optional[str]) -> str:
     return _doc_sectioned_no_code(
-        title=_filename_title(file_path, "css"),
+        title=_filename_title(file_name, "css"),
         what_it_does=["Controls how a web page looks (layout, spacing, fonts, colors)."],
         requirements=["A browser + an HTML file that links this CSS."],
         how_to_run=[
@@ -836,32 +1029,53 @@ def _css_docs(file_path: str) -> str:
 # Java (go harder: condition-aware “why” on validations)
 # ============================================================
 
-_JAVA_CLASS_RE = re.compile(r"^\s*(public\s+)?class\s+([A-Za-z_]\w*)")
-_JAVA_METHOD_RE = re.compile(r"^\s*(public|private|protected)\s+(static\s+)?([A-Za-z0-9_<>\[\]]+)\s+([A-Za-z_]\w*)\s*\(")
-_JAVA_CTOR_RE = re.compile(r"^\s*(public|private|protected)\s+([A-Za-z_]\w*)\s*\(")
-_JAVA_IF_RETURN_RE = re.compile(r"^\s*if\s*\((.+)\)\s*return\s+(true|false|null)\s*;")
-
-
-def _java_should_comment(s: str) -> bool:
-    if not s or s.startswith("//"):
-        return False
-
-    if s.startswith("import "):
-        return True
-    if _JAVA_CLASS_RE.match(s):
-        return True
-    if "public static void main" in s:
-        return True
-    if _JAVA_METHOD_RE.match(s) or _JAVA_CTOR_RE.match(s):
-        return True
-    if s.startswith(("private ", "public ", "protected ")) and s.endswith(";") and "(" not in s:
-        return True
-    if "this." in s:
-        return True
-    if s.startswith(("if", "for", "while", "try", "catch", "return ")):
-        return True
-
-    return False
+# (rule name, pattern, fixed comment) in priority order; the first rule that matches
+# wins. Rules with a None comment are filled in by _java_comment_for_line.
+_JAVA_LINE_COMMENT_RULES: Tuple[Tuple[str, str, Optional[str]], ...] = (
+    ("import", r"import ", "// Import: bring in classes from Java libraries."),
+    ("class", r"\s*(?:public\s+)?class\s+(?P<class_name>[A-Za-z_]\w*)", None),
+    ("main", r"(?=.*public static void main)", "// main(): Java starts running here."),
+    ("field", r"(?:private |public |protected )[^(]*;\Z", "// Field: stores information inside each object."),
+    (
+        "ctor",
+        r"(?!.*class)(?!.*void)\s*(?:public|private|protected)\s+(?P<ctor_name>[A-Za-z_]\w*)\s*\(",
+        None,
+    ),
+    (
+        "method",
+        r"(?!.*main)\s*(?:public|private|protected)\s+(?:static\s+)?"
+        r"(?P<ret_type>[A-Za-z0-9_<>\[\]]+)\s+(?P<method_name>[A-Za-z_]\w*)\s*\(",
+        None,
+    ),
+    # condition-aware early return
+    ("if_return", r"\s*if\s*\((?P<cond>.+)\)\s*return\s+(?:true|false|null)\s*;", None),
+    ("this", r"(?=.*this\.)", "// this.field = ... means: set a value on the current object."),
+    ("if", r"if", "// If-statement: run the next block only when the condition is true."),
+    ("for", r"for", "// Loop: repeat the next block multiple times."),
+    ("while", r"while", "// Loop: keep repeating while the condition stays true."),
+    ("try", r"try", "// Try: run code that might throw an exception."),
+    ("catch", r"catch", "// Catch: handle the error so the program does not crash."),
+    ("return", r"return ", "// Return: send a result back to the caller."),
+)
+
+# Comment lines never get a comment; every rule above already implies the line is
+# otherwise worth one, so that is the whole trigger check.
+_JAVA_LINE_COMMENT_RE = re.compile(
+    "(?s)(?!//)(?:"
+    + "|".join(f"(?P<{name}>{pat})" for name, pat, _ in _JAVA_LINE_COMMENT_RULES)
+    + ")"
+)
+_JAVA_LINE_COMMENTS: Dict[str, Optional[str]] = {name: c for name, _, c in _JAVA_LINE_COMMENT_RULES}
+
+# Loose version of the rules above, searched over a whole file: any line (after its
+# indentation) that could get a comment matches. No match means nothing to add.
+_JAVA_ANY_TRIGGER_RE = re.compile(
+    r"(?m)^[^\S\n]*(?!//)(?:"
+    r"import |public|private|protected|class"
+    r"|if|for|while|try|catch|return "
+    r"|.*?(?:public static void main|this\.)"
+    r")"
+)
 
 
 def _java_simple_condition_reason(cond: str) -> str:
@@ -889,89 +1103,57 @@ def _java_simple_condition_reason(cond: str) -> str:
     return f"because the condition ({cond.strip()}) is true"
 
 
-def _java_comment_for_line(s: str) -> Optional[str]:
-    st = s.strip()
+@_short_line_cache
+def _java_comment_for_line(st: str) -> Optional[str]:
+    # `st` is the already-stripped line; None when it does not deserve a comment
 
-    if st.startswith("import "):
-        return "// Import: bring in classes from Java libraries."
-
-    m = _JAVA_CLASS_RE.match(st)
-    if m:
-        name = m.group(2)
-        return f"// Class `{name}`: groups data (fields) and actions (methods)."
-
-    if "public static void main" in st:
-        return "// main(): Java starts running here."
+    m = _JAVA_LINE_COMMENT_RE.match(st)
+    if not m:
+        return None
 
-    if st.startswith(("private ", "public ", "protected ")) and st.endswith(";") and "(" not in st:
-        return "// Field: stores information inside each object."
+    rule = m.lastgroup
+    if rule == "class":
+        return f"// Class `{m.group('class_name')}`: groups data (fields) and actions (methods)."
 
-    mctor = _JAVA_CTOR_RE.match(st)
-    if mctor and "class" not in st and "void" not in st and "(" in st:
-        name = mctor.group(2)
-        return f"// Constructor `{name}(...)`: runs when creating a new object."
+    if rule == "ctor":
+        return f"// Constructor `{m.group('ctor_name')}(...)`: runs when creating a new object."
 
-    mm = _JAVA_METHOD_RE.match(st)
-    if mm and "main" not in st:
-        ret_type = mm.group(3)
-        name = mm.group(4)
+    if rule == "method":
+        ret_type = m.group("ret_type")
+        name = m.group("method_name")
         if ret_type == "void":
             return f"// Method `{name}(...)`: performs an action (no returned value)."
         return f"// Method `{name}(...)`: returns a `{ret_type}` result."
 
-    # condition-aware early return
-    m_if_ret = _JAVA_IF_RETURN_RE.match(st)
-    if m_if_ret:
-        cond = m_if_ret.group(1)
-        reason = _java_simple_condition_reason(cond)
+    if rule == "if_return":
+        reason = _java_simple_condition_reason(m.group("cond"))
         return f"// Stop here {reason}."
 
-    if "this." in st:
-        return "// this.field = ... means: set a value on the current object."
-
-    if st.startswith("if"):
-        return "// If-statement: run the next block only when the condition is true."
-
-    if st.startswith("for"):
-        return "// Loop: repeat the next block multiple times."
-
-    if st.startswith("while"):
-        return "// Loop: keep repeating while the condition stays true."
-
-    if st.startswith("try"):
-        return "// Try: run code that might throw an exception."
-
-    if st.startswith("catch"):
-        return "// Catch: handle the error so the program does not crash."
+    return _JAVA_LINE_COMMENTS[rule]
 
-    if st.startswith("return "):
-        return "// Return: send a result back to the caller."
 
-    return None
-
-
-def _comment_java(code: str, file_path: str) -> str:
+def _comment_java(code: str, file_name: Optional[str]) -> str:
     code = _clean_existing_auto_headers(code)
-    lines = code.splitlines()
-    out: List[str] = []
-    out.append(f"// File: {os.path.basename(file_path) if file_path else 'pasted_code'}")
-    out.append("")
+    header = f"// File: {_shown_name(file_name)}\n"
 
-    for line in lines:
-        s = line.strip()
-        if _java_should_comment(s):
-            c = _java_comment_for_line(s)
+    # cleaned code only has "\n" line breaks, so it is already the uncommented output
+    if _JAVA_ANY_TRIGGER_RE.search(code) is None:
+        return (header + "\n" + code).rstrip() + "\n"
+
+    def _iter_lines(lines: List[str]) -> Iterator[str]:
+        yield header
+        for line in lines:
+            c = _java_comment_for_line(line.strip())
             if c:
-                indent = re.match(r"^\s*", line).group(0)
-                out.append(f"{indent}{c}")
-        out.append(line)
+                yield f"{_leading_ws(line)}{c}"
+            yield line
 
-    return "\n".join(out).rstrip() + "\n"
+    return "\n".join(_iter_lines(code.splitlines())).rstrip() + "\n"
 
 
-def _java_docs(file_path: str) -> str:
+def _java_docs(file_name: Optional[str]) -> str:
     return _doc_sectioned_no_code(
-        title=_filename_title(file_path, "java"),
+        title=_filename_title(file_name, "java"),
         what_it_does=["Defines Java classes and methods; may run from `main()`."],
         requirements=["Java JDK installed."],
         how_to_run=[
@@ -994,6 +1176,15 @@ def _java_docs(file_path: str) -> str:
 # Public API: generate_simple_docs
 # ============================================================
 
+# language -> (commenter, docs builder); both take the file name from _base_name
+_SIMPLE_LANGUAGES: Dict[str, Tuple[Callable[[str, Optional[str]], str], Callable[[Optional[str]], str]]] = {
+    "javascript": (_comment_js, _js_docs),
+    "html": (_comment_html, _html_docs),
+    "css": (_comment_css, _css_docs),
+    "java": (_comment_java, _java_docs),
+}
+
+
 def generate_simple_docs(language: str, code: str, file_path: str = "pasted_code") -> Dict[str, Any]:
     language = (language or "").lower().strip()
     code_clean = code.replace("\r\n", "\n")
@@ -1001,20 +1192,15 @@ def generate_simple_docs(language: str, code: str, file_path: str = "pasted_code
     if language == "python":
         return generate_python_docs(code_clean, file_path=file_path)
 
-    if language == "javascript":
-        return {"commented_code": _comment_js(code_clean, file_path), "documentation": _js_docs(file_path)}
-
-    if language == "html":
-        return {"commented_code": _comment_html(code_clean, file_path), "documentation": _html_docs(file_path)}
-
-    if language == "css":
-        return {"commented_code": _comment_css(code_clean, file_path), "documentation": _css_docs(file_path)}
+    file_name = _base_name(file_path)
 
-    if language == "java":
-        return {"commented_code": _comment_java(code_clean, file_path), "documentation": _java_docs(file_path)}
+    handlers = _SIMPLE_LANGUAGES.get(language)
+    if handlers is not None:
+        comment, docs = handlers
+        return {"commented_code": comment(code_clean, file_name), "documentation": docs(file_name)}
 
     documentation = _doc_sectioned_no_code(
-        title=_filename_title(file_path, language or "unknown"),
+        title=_filename_title(file_name, language or "unknown"),
         what_it_does=["Part of a software project."],
         requirements=["Depends on the project."],
         how_to_run=["Depends on the project."],
@@ -1022,4 +1208,66 @@ def generate_simple_docs(language: str, code: str, file_path: str = "pasted_code
         examples=["Depends on the code."],
         edge_cases=["No extra notes."],
     )
-    return {"commented_code": code_clean.rstrip() + "\n", "documentation": documentation}
\ No newline at end of file
+    return {"commented_code": code_clean.rstrip() + "\n", "documentation": documentation}
+
+
+def _generate_simple_docs_item(item: Tuple[str, str, str]) -> Dict[str, Any]:
+    # module-level so worker processes can unpickle it
+    return generate_simple_docs(*item)
+
+
+def generate_simple_docs_batch(
+    items: List[Tuple[str, str, str]],
+    max_workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> List[Dict[str, Any]]:
+    """
+    generate_simple_docs for many (language, code, file_path) items, spread over
+    worker processes. Results come back in the same order as `items`.
+    Identical files are generated once: the output only depends on the language,
+    the code and the file's base name. Every item still gets its own dict.
+    Pass a long-lived `executor` to reuse its warm workers; otherwise a pool is
+    started for this call. With one item or one worker it runs in-process:
+    a pool would only add startup cost.
+    """
+    # index into `unique` for every item (e.g. many identical __init__.py files)
+    first: Dict[Tuple[str, str, Optional[str]], int] = {}
+    unique: List[Tuple[str, str, str]] = []
+    slots: List[int] = []
+    for item in items:
+        language, code, file_path = item
+        key = (language, code, _base_name(file_path))
+        slot = first.get(key)
+        if slot is None:
+            slot = first[key] = len(unique)
+            unique.append(item)
+        slots.append(slot)
+
+    outs = _generate_simple_docs_many(unique, max_workers, executor)
+    if len(unique) == len(items):
+        return outs
+
+    # duplicates get copies, so callers can edit one result without touching another
+    used = [False] * len(outs)
+    results: List[Dict[str, Any]] = []
+    for slot in slots:
+        results.append(dict(outs[slot]) if used[slot] else outs[slot])
+        used[slot] = True
+    return results
+
+
+def _generate_simple_docs_many(
+    items: List[Tuple[str, str, str]],
+    max_workers: Optional[int],
+    executor: Optional[Executor],
+) -> List[Dict[str, Any]]:
+    workers = max_workers or os.cpu_count() or 1
+    if len(items) < 2 or workers < 2:
+        return [generate_simple_docs(*item) for item in items]
+
+    # a few chunks per worker keeps them busy without pickling one item at a time
+    chunksize = max(1, len(items) // (workers * 4))
+    if executor is not None:
+        return list(executor.map(_generate_simple_docs_item, items, chunksize=chunksize))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_generate_simple_docs_item, items, chunksize=chunksize))
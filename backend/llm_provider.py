@@ -1,41 +1,60 @@
 import os
 import json
+from functools import lru_cache
 from typing import Optional, Dict, Any
 
 from openai import OpenAI
 
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+try:
+    # faster parse for long responses; its errors subclass json.JSONDecodeError
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
+from response_cache import ResponseCache, cache_key
+
+
+@lru_cache(maxsize=1)
+def _client() -> OpenAI:
+    # built on first use, so importing this module never needs an API key
+    return OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+
+
+# parsed responses, keyed by a hash of model name and prompt
+_response_cache = ResponseCache()
 
 
 def llm_available() -> bool:
     return bool(os.environ.get("OPENAI_API_KEY"))
 
 
-def _system_instructions() -> str:
-    return (
-        "You are a senior software engineer and technical writer. "
-        "Generate beginner-friendly code comments and documentation. "
-        "Be accurate. Do not invent behavior that is not present in the code. "
-        "Keep comments helpful and not excessive."
-    )
+_SYSTEM_INSTRUCTIONS = (
+    "You are a senior software engineer and technical writer. "
+    "Generate beginner-friendly code comments and documentation. "
+    "Be accurate. Do not invent behavior that is not present in the code. "
+    "Keep comments helpful and not excessive."
+)
+
+# {fp}, {language} and {code} are filled in by build_prompt (literal braces doubled)
+_PROMPT_TEMPLATE = (
+    "{fp}"
+    "Language: {language}\n"
+    "Task:\n"
+    "1) Return commented_code: the same code with meaningful inline comments and docstrings/JSDoc where appropriate.\n"
+    "2) Return documentation: a short README-style explanation (what it does, inputs/outputs, edge cases, example usage).\n\n"
+    "Output format:\n"
+    "Return ONLY valid JSON with exactly these keys:\n"
+    '{{ "commented_code": "...", "documentation": "..." }}\n\n'
+    "CODE:\n"
+    "-----\n"
+    "{code}\n"
+    "-----\n"
+)
 
 
 def build_prompt(language: str, code: str, file_path: Optional[str] = None) -> str:
     fp = f"File path: {file_path}\n" if file_path else ""
-    return (
-        f"{fp}"
-        f"Language: {language}\n"
-        "Task:\n"
-        "1) Return commented_code: the same code with meaningful inline comments and docstrings/JSDoc where appropriate.\n"
-        "2) Return documentation: a short README-style explanation (what it does, inputs/outputs, edge cases, example usage).\n\n"
-        "Output format:\n"
-        "Return ONLY valid JSON with exactly these keys:\n"
-        '{ "commented_code": "...", "documentation": "..." }\n\n'
-        "CODE:\n"
-        "-----\n"
-        f"{code}\n"
-        "-----\n"
-    )
+    return _PROMPT_TEMPLATE.format(fp=fp, language=language, code=code)
 
 
 def generate_with_llm(language: str, code: str, file_path: Optional[str] = None) -> Dict[str, Any]:
@@ -46,9 +65,15 @@ def generate_with_llm(language: str, code: str, file_path: Optional[str] = None)
     model = os.environ.get("DOCGEN_MODEL", "gpt-4o")
     prompt = build_prompt(language=language, code=code, file_path=file_path)
 
-    response = client.responses.create(
+    key = cache_key(model, prompt)
+    cached = _response_cache.get(key)
+    if cached is not None:
+        # copy: callers may edit the dict they get back
+        return dict(cached)
+
+    response = _client().responses.create(
         model=model,
-        instructions=_system_instructions(),
+        instructions=_SYSTEM_INSTRUCTIONS,
         input=prompt,
     )
 
@@ -56,13 +81,13 @@ def generate_with_llm(language: str, code: str, file_path: Optional[str] = None)
 
     # Parse JSON strictly; try to recover if extra text exists
     try:
-        return json.loads(text)
+        return _remember(key, _json_loads(text))
     except json.JSONDecodeError:
         start = text.find("{")
         end = text.rfind("}")
         if start != -1 and end != -1 and end > start:
             try:
-                return json.loads(text[start: end + 1])
+                return _remember(key, _json_loads(text[start: end + 1]))
             except Exception:
                 pass
 
@@ -70,3 +95,11 @@ def generate_with_llm(language: str, code: str, file_path: Optional[str] = None)
         "commented_code": code,
         "documentation": "LLM output parsing failed. Returned original code."
     }
+
+
+def _remember(key: str, parsed: Any) -> Any:
+    # only JSON objects are cached; the fallback above is never cached
+    if isinstance(parsed, dict):
+        _response_cache.put(key, parsed)
+        return dict(parsed)
+    return parsed
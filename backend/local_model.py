@@ -1,16 +1,35 @@
 from pathlib import Path
+from typing import Dict, List
+import threading
+
 import torch
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 
+from response_cache import ResponseCache, cache_key
+
 # Path to the trained model (from research folder)
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 MODEL_DIR = PROJECT_ROOT / "research" / "models" / "codet5-small-commenter"
 
 TASK_PREFIX = "comment: "
 MAX_INPUT_LEN = 256
+# snippets per model.generate() call in generate_comments
+BATCH_SIZE = 8
+# greedy decoding: the output is a one-line summary, and beam search ran the
+# decoder once per beam at every step
+NUM_BEAMS = 1
+# compiled GPU path: inputs are padded up to a multiple of this and batches to
+# BATCH_SIZE, so only MAX_INPUT_LEN // LENGTH_BUCKET shapes ever reach the graphs
+LENGTH_BUCKET = 64
 
 _tokenizer = None
 _model = None
+# True once the static cache + compiled forward is in use; that state lives on
+# the model, so generate() calls must not overlap
+_static_shapes = False
+_generate_lock = threading.Lock()
+# comment per snippet, keyed by a hash of the snippet
+_comment_cache = ResponseCache()
 
 
 def load_model():
@@ -19,27 +38,124 @@ def load_model():
         _tokenizer = AutoTokenizer.from_pretrained(str(MODEL_DIR))
         _model = AutoModelForSeq2SeqLM.from_pretrained(str(MODEL_DIR))
         _model.eval()
+        if torch.cuda.is_available():
+            _model = _prepare_for_gpu(_tokenizer, _model)
     return _tokenizer, _model
 
 
+def _prepare_for_gpu(tokenizer, model):
+    """
+    bf16 weights (fp32 if the GPU has no bf16: T5 models overflow in fp16),
+    a static KV cache and a compiled forward. Warm up every served shape here so
+    requests do not pay the compile; fall back to eager if compiling fails.
+    """
+    global _static_shapes
+    dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float32
+    model = model.to(device="cuda", dtype=dtype)
+
+    eager_forward = model.forward
+    try:
+        model.generation_config.cache_implementation = "static"
+        model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=True)
+        _static_shapes = True
+        _warm_up(tokenizer, model)
+    except Exception:
+        _static_shapes = False
+        model.generation_config.cache_implementation = None
+        model.forward = eager_forward
+    return model
+
+
+def _warm_up(tokenizer, model) -> None:
+    # one full batch per length bucket: the shapes _generate_batch sends
+    ids = tokenizer(TASK_PREFIX + "def add(a, b):\n    return a + b")["input_ids"]
+    for length in range(LENGTH_BUCKET, MAX_INPUT_LEN + 1, LENGTH_BUCKET):
+        row = (ids * (length // len(ids) + 1))[:length]
+        input_ids = torch.tensor([row] * BATCH_SIZE, device=model.device)
+        with torch.inference_mode():
+            _generate_ids(model, input_ids=input_ids, attention_mask=torch.ones_like(input_ids))
+
+
 def generate_comment(code: str) -> str:
-    tokenizer, model = load_model()
+    return generate_comments([code])[0]
+
+
+def generate_comments(codes: List[str], batch_size: int = BATCH_SIZE) -> List[str]:
+    """
+    One comment per snippet, in the same order as `codes`.
+    Snippets already seen come from the cache; the rest are sorted by length
+    and generated in batches of similar size, so each batch is padded once
+    and padding stays small.
+    """
+    if not codes:
+        return []
+
+    keys = [cache_key(code) for code in codes]
+    comments: List[str] = [""] * len(codes)
+    # first index of every distinct snippet the cache does not know yet
+    missing: Dict[str, int] = {}
+    for i, key in enumerate(keys):
+        cached = _comment_cache.get(key)
+        if cached is not None:
+            comments[i] = cached
+        elif key not in missing:
+            missing[key] = i
 
-    prompt = TASK_PREFIX + code
+    if missing:
+        tokenizer, model = load_model()
+
+        order = sorted(missing.values(), key=lambda i: len(codes[i]))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            texts = _generate_batch(tokenizer, model, [TASK_PREFIX + codes[i] for i in batch])
+            for i, text in zip(batch, texts):
+                comments[i] = text.strip()
+                _comment_cache.put(keys[i], comments[i])
+
+        # duplicates of a snippet generated above
+        for i, key in enumerate(keys):
+            first = missing.get(key)
+            if first is not None and first != i:
+                comments[i] = comments[first]
+
+    return comments
+
+
+def _generate_batch(tokenizer, model, prompts: List[str]) -> List[str]:
+    count = len(prompts)
+    extra = {}
+    if _static_shapes:
+        # fixed shapes on the compiled path: fill the batch, pad to a length bucket
+        if count < BATCH_SIZE:
+            prompts = prompts + [prompts[-1]] * (BATCH_SIZE - count)
+        extra["pad_to_multiple_of"] = LENGTH_BUCKET
+
+    # encoder inputs: right padding is fine for T5, only decoder-only models need left
     inputs = tokenizer(
-        prompt,
+        prompts,
         max_length=MAX_INPUT_LEN,
         truncation=True,
+        padding=True,
         return_tensors="pt",
-    )
+        **extra,
+    ).to(model.device)
 
-    with torch.no_grad():
-        out_ids = model.generate(
-            **inputs,
-            max_new_tokens=64,
-            num_beams=4,
-            no_repeat_ngram_size=3,
-        )
+    with torch.inference_mode():
+        if _static_shapes:
+            # the static KV cache and CUDA graph buffers are shared by all callers
+            with _generate_lock:
+                out_ids = _generate_ids(model, **inputs)
+        else:
+            out_ids = _generate_ids(model, **inputs)
 
-    return tokenizer.decode(out_ids[0], skip_special_tokens=True).strip()
+    return tokenizer.batch_decode(out_ids[:count], skip_special_tokens=True)
 
+
+def _generate_ids(model, **inputs):
+    return model.generate(
+        **inputs,
+        max_new_tokens=64,
+        num_beams=NUM_BEAMS,
+        do_sample=False,
+        no_repeat_ngram_size=3,
+    )
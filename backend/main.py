@@ -1,16 +1,23 @@
 from __future__ import annotations
 
 from fastapi import FastAPI, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Tuple, Deque, Iterator
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+import multiprocessing
+import threading
 import zipfile
 import io
 import os
 import re
 
-from generators import generate_python_docs, generate_simple_docs
+from generators import generate_python_docs, generate_simple_docs, generate_simple_docs_batch
 
 # Optional: llm_provider.py
 try:
@@ -22,17 +29,26 @@ except Exception:
 
 # ============================================================
 # Local AI model safety:
-# - NEVER import torch/model at startup
-# - Only try when user requests AI
+# - Do not import torch/model at startup, unless ENABLE_LOCAL_AI=1
+#   asks for the model to be loaded before the first request
+# - Otherwise only try when user requests AI
 # - If it fails, still return rule-based output
 # ============================================================
 
+# None until the first check; a failed import is not cached by Python,
+# so without this every AI request would retry it
+_local_ai_ok: Optional[bool] = None
+
+
 def _local_ai_is_available() -> bool:
-    try:
-        from local_model import generate_comment as _gen  # noqa: F401
-        return True
-    except Exception:
-        return False
+    global _local_ai_ok
+    if _local_ai_ok is None:
+        try:
+            from local_model import generate_comment as _gen  # noqa: F401
+            _local_ai_ok = True
+        except Exception:
+            _local_ai_ok = False
+    return _local_ai_ok
 
 
 def _generate_with_local_model(code: str) -> str:
@@ -40,7 +56,66 @@ def _generate_with_local_model(code: str) -> str:
     return _gen(code)
 
 
-app = FastAPI(title="AI Code Comment & Docs API", version="1.2")
+def _generate_with_local_model_batch(codes: List[str]) -> List[str]:
+    from local_model import generate_comments as _gen_many
+    return _gen_many(codes)
+
+
+# worker processes for rule-based ZIP output, kept for the app's lifetime so each
+# upload does not start (and re-import into) a fresh pool. The worker count is
+# explicit: os.cpu_count() reports host cores, not what a small container gets.
+DOC_POOL_WORKERS = int(os.getenv("DOC_POOL_WORKERS", "2"))
+
+_doc_pool: Optional[ProcessPoolExecutor] = None
+_doc_pool_lock = threading.Lock()
+
+
+def _new_doc_pool() -> ProcessPoolExecutor:
+    # no fork: requests run on threadpool threads, and torch/CUDA may already be
+    # loaded in this process (ENABLE_LOCAL_AI=1)
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(
+        max_workers=DOC_POOL_WORKERS,
+        mp_context=multiprocessing.get_context(method),
+    )
+
+
+def _replace_broken_doc_pool(broken: ProcessPoolExecutor) -> None:
+    global _doc_pool
+    with _doc_pool_lock:
+        # another request may have replaced it already
+        if _doc_pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            _doc_pool = _new_doc_pool()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _doc_pool
+    # opt-in warm start: the first AI request skips the multi-second model load
+    if os.getenv("ENABLE_LOCAL_AI") == "1" and _local_ai_is_available():
+        try:
+            from local_model import load_model
+            load_model()
+        except Exception:
+            pass
+
+    _doc_pool = _new_doc_pool()
+    try:
+        yield
+    finally:
+        pool, _doc_pool = _doc_pool, None
+        pool.shutdown(cancel_futures=True)
+
+
+# orjson encodes the large documentation strings in /generate responses much
+# faster than the stdlib json encoder
+app = FastAPI(
+    title="AI Code Comment & Docs API",
+    version="1.2",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -67,6 +142,15 @@ EXTENSIONS_BY_LANGUAGE = {
 
 ALL_SUPPORTED_EXTS = sorted({e for v in EXTENSIONS_BY_LANGUAGE.values() for e in v})
 
+LANGUAGE_BY_EXTENSION = {e: lang for lang, exts in EXTENSIONS_BY_LANGUAGE.items() for e in exts}
+
+# Source files bigger than this (uncompressed) are skipped instead of read
+MAX_FILE_BYTES = 2 * 1024 * 1024
+
+# deflate level for the download ZIP: level 1 is ~3x faster than the default 6
+# and the text output still compresses well
+ZIP_COMPRESSLEVEL = 1
+
 
 @app.get("/")
 def root():
@@ -79,11 +163,7 @@ def root():
 
 
 def guess_language_from_filename(filename: str) -> Optional[str]:
-    _, ext = os.path.splitext(filename.lower())
-    for lang, exts in EXTENSIONS_BY_LANGUAGE.items():
-        if ext in exts:
-            return lang
-    return None
+    return LANGUAGE_BY_EXTENSION.get(os.path.splitext(filename)[1].lower())
 
 
 def generate_rule_based(language: str, code: str, file_path: str) -> Dict[str, Any]:
@@ -92,6 +172,9 @@ def generate_rule_based(language: str, code: str, file_path: str) -> Dict[str, A
     return generate_simple_docs(language, code, file_path=file_path)
 
 
+_CODE_LIKE_START_RE = re.compile(r"^(return|var|let|const|public|private|function)\b", re.I)
+
+
 def _looks_like_bad_ai_summary(text: str) -> bool:
     t = (text or "").strip()
     if not t:
@@ -100,7 +183,7 @@ def _looks_like_bad_ai_summary(text: str) -> bool:
         return True
     if ";" in t or "{" in t or "}" in t:
         return True
-    if re.match(r"^(return|var|let|const|public|private|function)\b", t, re.I):
+    if _CODE_LIKE_START_RE.match(t):
         return True
     return False
 
@@ -117,22 +200,52 @@ def generate_any(language: str, code: str, file_path: str, use_ai: bool) -> Dict
         return base
 
     try:
-        ai_summary = _generate_with_local_model(code)
-        if _looks_like_bad_ai_summary(ai_summary):
-            base["note"] = "AI summary looked like code, ignored it."
-            return base
-
-        base["documentation"] = (
-            "## Optional AI summary\n"
-            f"- {ai_summary.strip()}\n\n"
-            + base["documentation"]
-        )
-        return base
+        return _apply_ai_summary(base, _generate_with_local_model(code))
     except Exception as e:
         base["note"] = f"AI failed; used rule-based output. Error: {str(e)}"
         return base
 
 
+def _apply_ai_summary(base: Dict[str, Any], ai_summary: str) -> Dict[str, Any]:
+    if _looks_like_bad_ai_summary(ai_summary):
+        base["note"] = "AI summary looked like code, ignored it."
+        return base
+
+    base["documentation"] = (
+        "## Optional AI summary\n"
+        f"- {ai_summary.strip()}\n\n"
+        + base["documentation"]
+    )
+    return base
+
+
+def _add_ai_summaries(bases: List[Dict[str, Any]], codes: List[str]) -> None:
+    """
+    Same as the AI part of generate_any, for many files at once:
+    the local model gets all snippets in one batched call.
+    """
+    if not bases:
+        return
+
+    if not _local_ai_is_available():
+        for base in bases:
+            base["note"] = "AI was requested, but AI is disabled on this server. Used rule-based output."
+        return
+
+    try:
+        summaries = _generate_with_local_model_batch(codes)
+    except Exception as e:
+        for base in bases:
+            base["note"] = f"AI failed; used rule-based output. Error: {str(e)}"
+        return
+
+    for base, ai_summary in zip(bases, summaries):
+        try:
+            _apply_ai_summary(base, ai_summary)
+        except Exception as e:
+            base["note"] = f"AI failed; used rule-based output. Error: {str(e)}"
+
+
 @app.post("/generate")
 def generate(req: GenerateRequest):
     return generate_any(req.language, req.code, "pasted_code", bool(req.use_ai))
@@ -143,8 +256,9 @@ def read_zip_and_generate(
     preferred_language: Optional[str],
     use_ai: bool,
 ) -> Tuple[List[Dict[str, Any]], List[str]]:
-    results: List[Dict[str, Any]] = []
     skipped: List[str] = []
+    # (path, language, code) for every supported file
+    entries: List[Tuple[str, str, str]] = []
 
     with zipfile.ZipFile(io.BytesIO(zip_bytes), "r") as z:
         for info in z.infolist():
@@ -152,29 +266,55 @@ def read_zip_and_generate(
                 continue
 
             path = info.filename
-            _, ext = os.path.splitext(path.lower())
 
-            if ext not in ALL_SUPPORTED_EXTS:
+            # extension parsed once per entry (only the extension is lowercased);
+            # it also picks the language
+            guessed = LANGUAGE_BY_EXTENSION.get(os.path.splitext(path)[1].lower())
+            if guessed is None:
                 skipped.append(path)
                 continue
 
-            raw = z.read(info)
-            code = raw.decode("utf-8", errors="replace")
+            # file_size is the uncompressed size; ZipFile never returns more than that
+            if info.file_size > MAX_FILE_BYTES:
+                skipped.append(f"{path} (too large: {info.file_size} bytes)")
+                continue
 
-            lang = preferred_language or guess_language_from_filename(path) or "unknown"
-            out = generate_any(lang, code, path, use_ai)
+            # empty entries still get output; there is just nothing to open
+            code = z.read(info).decode("utf-8", errors="replace") if info.file_size else ""
+
+            lang = preferred_language or guessed
+            entries.append((path, lang, code))
+
+    # rule-based output for all files across worker processes (same result as
+    # generate_rule_based: generate_simple_docs routes python the same way)
+    outs = _generate_rule_based_batch([(lang, code, path) for path, lang, code in entries])
+    if use_ai:
+        # one batched model call for the whole archive instead of one per file
+        _add_ai_summaries(outs, [code for _, _, code in entries])
+
+    results: List[Dict[str, Any]] = [
+        {
+            "file": path,
+            "language": lang,
+            "commented_code": out["commented_code"],
+            "documentation": out["documentation"],
+            "note": out.get("note"),
+        }
+        for (path, lang, _), out in zip(entries, outs)
+    ]
+    return results, skipped
 
-            results.append(
-                {
-                    "file": path,
-                    "language": lang,
-                    "commented_code": out["commented_code"],
-                    "documentation": out["documentation"],
-                    "note": out.get("note"),
-                }
-            )
 
-    return results, skipped
+def _generate_rule_based_batch(items: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+    pool = _doc_pool
+    try:
+        return generate_simple_docs_batch(items, max_workers=DOC_POOL_WORKERS, executor=pool)
+    except BrokenProcessPool:
+        # a worker died (e.g. killed for memory): later requests get a fresh
+        # pool, this one finishes in-process
+        if pool is not None:
+            _replace_broken_doc_pool(pool)
+        return generate_simple_docs_batch(items, max_workers=1)
 
 
 def _md_escape_backticks(s: str) -> str:
@@ -190,16 +330,14 @@ def build_project_readme(results: List[Dict[str, Any]], skipped: List[str]) -> s
     lines.append("")
     lines.append("## Summary")
     lines.append(f"- Files documented: **{len(results)}**")
-    lines.append(f"- Files skipped (unsupported): **{len(skipped)}**")
+    lines.append(f"- Files skipped (unsupported or too large): **{len(skipped)}**")
     lines.append("")
     lines.append("## Files included")
-    for r in results:
-        lines.append(f"- `{_md_escape_backticks(r['file'])}` ({r['language']})")
+    lines.extend([f"- `{_md_escape_backticks(r['file'])}` ({r['language']})" for r in results])
     lines.append("")
     if skipped:
         lines.append("## Skipped files")
-        for s in skipped:
-            lines.append(f"- `{_md_escape_backticks(s)}`")
+        lines.extend([f"- `{_md_escape_backticks(s)}`" for s in skipped])
         lines.append("")
     lines.append("## Notes")
     lines.append("- Comments are designed to explain confusing parts without spamming every line.")
@@ -208,29 +346,69 @@ def build_project_readme(results: List[Dict[str, Any]], skipped: List[str]) -> s
     return "\n".join(lines)
 
 
-@app.post("/generate-zip-download")
-async def generate_zip_download(
-    zip_file: UploadFile = File(...),
-    preferred_language: Optional[str] = Form(default=None),
-    use_ai: Optional[bool] = Form(default=False),
-):
-    data = await zip_file.read()
-    results, skipped = read_zip_and_generate(data, preferred_language, bool(use_ai))
+class _ZipChunks(io.RawIOBase):
+    """
+    Write-only sink for zipfile.ZipFile: keeps written bytes until drained.
+    It cannot seek, so ZipFile streams entries with data descriptors.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks: Deque[bytes] = deque()
+
+    def writable(self) -> bool:
+        return True
 
-    buffer = io.BytesIO()
-    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as out:
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> Iterator[bytes]:
+        # one chunk per drain: ZipFile writes headers and data in many small pieces
+        if self._chunks:
+            data = b"".join(self._chunks)
+            self._chunks.clear()
+            yield data
+
+
+def iter_zip_download(results: List[Dict[str, Any]], skipped: List[str]) -> Iterator[bytes]:
+    """
+    Build the download ZIP piece by piece: bytes go out after every file,
+    so the whole archive never sits in memory.
+    """
+    sink = _ZipChunks()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED, compresslevel=ZIP_COMPRESSLEVEL) as out:
         for r in results:
             out.writestr(r["file"], r["commented_code"])
+            yield from sink.drain()
 
         readme = build_project_readme(results, skipped)
         out.writestr("PROJECT_README.md", readme)
 
         if skipped:
             out.writestr("SKIPPED_FILES.txt", "\n".join(skipped))
+        yield from sink.drain()
+
+    # central directory, written on close
+    yield from sink.drain()
+
+
+@app.post("/generate-zip-download")
+async def generate_zip_download(
+    zip_file: UploadFile = File(...),
+    preferred_language: Optional[str] = Form(default=None),
+    use_ai: Optional[bool] = Form(default=False),
+):
+    data = await zip_file.read()
+    # unzipping, parsing and the pool round-trip block; keep them off the event loop
+    results, skipped = await run_in_threadpool(
+        read_zip_and_generate, data, preferred_language, bool(use_ai)
+    )
 
-    buffer.seek(0)
+    # sync generator: Starlette runs it in a worker thread, so compression
+    # does not block the event loop
     return StreamingResponse(
-        buffer,
+        iter_zip_download(results, skipped),
         media_type="application/zip",
         headers={"Content-Disposition": "attachment; filename=docgen_project.zip"},
     )
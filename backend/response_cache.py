@@ -0,0 +1,48 @@
+from collections import OrderedDict
+import hashlib
+import threading
+from typing import Any, Optional
+
+# entries kept per cache before the least recently used one is dropped
+MAX_ENTRIES = 2048
+
+
+def cache_key(*parts: str) -> str:
+    """
+    Short digest of the model input. Parts are separated by NUL so
+    ("ab", "c") and ("a", "bc") never share a key; each part is fed to the
+    hash on its own, so no joined copy of a large snippet is built.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for i, part in enumerate(parts):
+        if i:
+            h.update(b"\0")
+        h.update(part.encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """
+    Exact-match LRU for model output, so re-uploading the same project
+    does not send every unchanged file through the model again.
+    Requests run in a thread pool, so every access takes the lock.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES) -> None:
+        self._max_entries = max_entries
+        self._items: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self._max_entries:
+                self._items.popitem(last=False)
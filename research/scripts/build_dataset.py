@@ -14,6 +14,7 @@ Output format per line (JSONL):
 
 import ast
 import json
+import os
 import random
 import re
 from pathlib import Path
@@ -29,6 +30,10 @@ TRAIN_FILE = PROCESSED_DIR / "train.jsonl"
 VALID_FILE = PROCESSED_DIR / "valid.jsonl"
 TEST_FILE = PROCESSED_DIR / "test.jsonl"
 
+# Comment block patterns (compiled once, used for every file / line)
+JSDOC_BLOCK_RE = re.compile(r"/\*\*([\s\S]*?)\*/")
+JSDOC_LINE_PREFIX_RE = re.compile(r"^\s*\*\s?")
+
 
 def ensure_dirs():
     PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
@@ -38,9 +43,14 @@ def ensure_dirs():
 # Comment extractors
 # -----------------------
 
+# statement-level nodes: the only places a def/class can appear
+_PY_BLOCK_NODES = (ast.stmt, ast.excepthandler, ast.match_case)
+
+
 def extract_python_docstrings(code: str) -> str:
     """
-    Extracts module docstring + function docstrings.
+    Extracts module docstring + function/class docstrings, including
+    methods and nested defs, in source order.
     Returns a combined text string.
     """
     try:
@@ -54,11 +64,16 @@ def extract_python_docstrings(code: str) -> str:
     if module_doc:
         parts.append(module_doc.strip())
 
-    for node in tree.body:
+    # depth-first over statements only; expressions cannot hold a def
+    stack = list(reversed(tree.body))
+    while stack:
+        node = stack.pop()
         if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
             doc = ast.get_docstring(node)
             if doc:
                 parts.append(doc.strip())
+        children = [c for c in ast.iter_child_nodes(node) if isinstance(c, _PY_BLOCK_NODES)]
+        stack.extend(reversed(children))
 
     return "\n\n".join(parts).strip()
 
@@ -70,13 +85,17 @@ def extract_jsdoc(code: str) -> str:
      * ...
      */
     """
-    blocks = re.findall(r"/\*\*([\s\S]*?)\*/", code)
+    blocks = JSDOC_BLOCK_RE.findall(code)
     cleaned = []
     for b in blocks:
         # remove leading stars
         lines = []
         for line in b.splitlines():
-            line = re.sub(r"^\s*\*\s?", "", line).rstrip()
+            # the prefix is anchored, so match + slice instead of a full sub() scan
+            m = JSDOC_LINE_PREFIX_RE.match(line)
+            if m:
+                line = line[m.end():]
+            line = line.rstrip()
             if line:
                 lines.append(line)
         text = "\n".join(lines).strip()
@@ -111,6 +130,30 @@ def guess_language_from_suffix(suffix: str) -> Optional[str]:
 # Dataset loading
 # -----------------------
 
+def _iter_files(base: str, rel: str = ""):
+    """
+    Yields (path, relative path) for every file under `base`, like
+    Path.rglob("*") + is_file(): directory symlinks are not followed,
+    unreadable directories are skipped. os.scandir reuses the type info from
+    the directory listing, so there is no extra stat per entry.
+    """
+    try:
+        with os.scandir(base) as it:
+            entries = list(it)
+    except OSError:
+        return
+
+    for entry in entries:
+        entry_rel = os.path.join(rel, entry.name) if rel else entry.name
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_files(entry.path, entry_rel)
+            elif entry.is_file():
+                yield entry.path, entry_rel
+        except OSError:
+            continue
+
+
 def load_local_nigeria_code() -> List[Dict[str, Any]]:
     """
     Load locally sourced Nigerian developer code samples from:
@@ -123,16 +166,14 @@ def load_local_nigeria_code() -> List[Dict[str, Any]]:
     samples: List[Dict[str, Any]] = []
     base = RAW_DIR / "nigeria_local"
 
-    for path in base.rglob("*"):
-        if not path.is_file():
-            continue
-
-        lang = guess_language_from_suffix(path.suffix)
+    for path, rel in _iter_files(str(base)):
+        lang = guess_language_from_suffix(os.path.splitext(path)[1])
         if not lang:
             continue
 
         try:
-            code = path.read_text(encoding="utf-8", errors="ignore")
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                code = f.read()
         except Exception:
             continue
 
@@ -152,7 +193,7 @@ def load_local_nigeria_code() -> List[Dict[str, Any]]:
         samples.append({
             "source": "nigeria_local",
             "language": lang,
-            "file": str(path.relative_to(base)),
+            "file": rel,
             "code": code,
             "comment": comment
         })
@@ -180,10 +221,15 @@ def split_dataset(data: List[Dict[str, Any]], train_ratio=0.8, valid_ratio=0.1)
     return data[:train_end], data[train_end:valid_end], data[valid_end:]
 
 
+# one encoder for every record (json.dumps builds a new one per call for non-default options)
+_JSONL_ENCODER = json.JSONEncoder(ensure_ascii=False)
+
+
 def write_jsonl(path: Path, data: List[Dict[str, Any]]):
+    # the records are already in memory, so the file is written in a single call
+    text = "".join([_JSONL_ENCODER.encode(item) + "\n" for item in data])
     with path.open("w", encoding="utf-8") as f:
-        for item in data:
-            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        f.write(text)
 
 
 def main():
@@ -14,6 +14,8 @@ TEST_PATH = DATA_DIR / "test.jsonl"
 
 TASK_PREFIX = "comment: "
 MAX_INPUT_LEN = 256
+# test examples per model.generate() call
+BATCH_SIZE = 16
 
 
 def to_summary(text: str) -> str:
@@ -42,19 +44,38 @@ def load_test_examples(path: Path):
     return examples
 
 
-def generate_predictions(codes):
-    tokenizer = AutoTokenizer.from_pretrained(str(MODEL_DIR))
-    model = AutoModelForSeq2SeqLM.from_pretrained(str(MODEL_DIR))
+_tokenizer = None
+_model = None
 
-    preds = []
-    for code in codes:
-        prompt = TASK_PREFIX + code
+
+def load_model():
+    # loaded once per process; later calls reuse the same tokenizer/model
+    global _tokenizer, _model
+    if _tokenizer is None or _model is None:
+        _tokenizer = AutoTokenizer.from_pretrained(str(MODEL_DIR))
+        _model = AutoModelForSeq2SeqLM.from_pretrained(str(MODEL_DIR))
+        _model.eval()
+        if torch.cuda.is_available():
+            _model = _model.to("cuda")
+    return _tokenizer, _model
+
+
+def generate_predictions(codes, batch_size=BATCH_SIZE):
+    tokenizer, model = load_model()
+
+    # similar lengths share a batch, so each batch is padded only to its longest
+    # input; predictions go back in the order of `codes`
+    order = sorted(range(len(codes)), key=lambda i: len(codes[i]))
+    preds = [""] * len(codes)
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
         inputs = tokenizer(
-            prompt,
+            [TASK_PREFIX + codes[i] for i in batch],
             max_length=MAX_INPUT_LEN,
             truncation=True,
+            padding=True,
             return_tensors="pt",
-        )
+        ).to(model.device)
         with torch.no_grad():
             out_ids = model.generate(
                 **inputs,
@@ -62,8 +83,8 @@ def generate_predictions(codes):
                 num_beams=4,
                 no_repeat_ngram_size=3,
             )
-        pred = tokenizer.decode(out_ids[0], skip_special_tokens=True).strip()
-        preds.append(pred)
+        for i, pred in zip(batch, tokenizer.batch_decode(out_ids, skip_special_tokens=True)):
+            preds[i] = pred.strip()
     return preds
 
 
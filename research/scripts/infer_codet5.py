@@ -9,9 +9,24 @@ MAX_INPUT_LEN = 256
 TASK_PREFIX = "comment: "
 
 
+_tokenizer = None
+_model = None
+
+
+def load_model():
+    # loaded once per process; later calls reuse the same tokenizer/model
+    global _tokenizer, _model
+    if _tokenizer is None or _model is None:
+        _tokenizer = AutoTokenizer.from_pretrained(str(MODEL_DIR))
+        _model = AutoModelForSeq2SeqLM.from_pretrained(str(MODEL_DIR))
+        _model.eval()
+        if torch.cuda.is_available():
+            _model = _model.to("cuda")
+    return _tokenizer, _model
+
+
 def generate_comment(code: str) -> str:
-    tokenizer = AutoTokenizer.from_pretrained(str(MODEL_DIR))
-    model = AutoModelForSeq2SeqLM.from_pretrained(str(MODEL_DIR))
+    tokenizer, model = load_model()
 
     prompt = TASK_PREFIX + code
 
@@ -20,7 +35,7 @@ def generate_comment(code: str) -> str:
         max_length=MAX_INPUT_LEN,
         truncation=True,
         return_tensors="pt"
-    )
+    ).to(model.device)
 
     with torch.no_grad():
         output_ids = model.generate(
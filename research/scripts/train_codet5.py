@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 
+import torch
 from datasets import load_dataset
 from transformers import (
     AutoTokenizer,
@@ -45,18 +46,18 @@ def main():
         inputs = [TASK_PREFIX + c for c in examples["code"]]
         targets = examples["comment"]
 
+        # no padding here: the collator pads each batch to its longest example,
+        # and pads labels with -100 so padding is left out of the loss
         model_inputs = tokenizer(
             inputs,
             max_length=MAX_INPUT_LEN,
             truncation=True,
-            padding="max_length",
         )
 
         labels = tokenizer(
-            targets,
+            text_target=targets,
             max_length=MAX_TARGET_LEN,
             truncation=True,
-            padding="max_length",
         )
 
         model_inputs["labels"] = labels["input_ids"]
@@ -67,18 +68,28 @@ def main():
 
     data_collator = DataCollatorForSeq2Seq(tokenizer=tokenizer, model=model)
 
+    # GPU: bf16 autocast (not fp16, T5 overflows in it), fused AdamW, a compiled
+    # model and batches of 8. CPU keeps the original fp32, batch-size-1 setup.
+    on_gpu = torch.cuda.is_available()
+    use_bf16 = on_gpu and torch.cuda.is_bf16_supported()
+    batch_size = 8 if on_gpu else 1
+
     args = TrainingArguments(
         output_dir=str(OUT_DIR),
-        per_device_train_batch_size=1,
-        per_device_eval_batch_size=1,
+        per_device_train_batch_size=batch_size,
+        per_device_eval_batch_size=batch_size,
         num_train_epochs=5,          # more epochs helps small data
-        learning_rate=5e-5,
+        # scaled with the batch (linear rule): 8x larger batches take 8x fewer steps
+        learning_rate=5e-5 * batch_size,
         logging_steps=1,
         save_steps=10,
         save_total_limit=2,
         eval_strategy="no",
         report_to="none",
         fp16=False,
+        bf16=use_bf16,
+        optim="adamw_torch_fused" if on_gpu else "adamw_torch",
+        torch_compile=on_gpu,
     )
 
     trainer = Trainer(
@@ -89,7 +100,7 @@ def main():
         data_collator=data_collator,
     )
 
-    print("Training (CPU)...")
+    print("Training (GPU)..." if on_gpu else "Training (CPU)...")
     trainer.train()
 
     print("Saving model...")